@@ -39,23 +39,29 @@ def _find_balanced_double_brace_spans(s: str):
     # Returns list of (start_idx, end_idx_exclusive, inner_content) for all balanced pairs.
     spans = []
     stack = []
-    i, n = 0, len(s)
-    while i < n - 1:
-        duo = s[i:i+2]
-        if duo == "{{":
-            stack.append(i)
-            i += 2
+    # Jump between delimiters with str.find instead of slicing every character.
+    # o/c cache the next '{{'/'}}' index; only the consumed (or overtaken) one is re-searched, -1 means exhausted.
+    find = s.find
+    o = find("{{")
+    c = find("}}")
+    while o != -1 or c != -1:
+        if c == -1 or (o != -1 and o < c):
+            stack.append(o)
+            i = o + 2
+            o = find("{{", i)
+            if c != -1 and c < i:
+                c = find("}}", i)
             continue
-        if duo == "}}":
-            if not stack:
-                raise CompileError("Unbalanced braces: found '}}' without matching '{{'.")
-            start = stack.pop()
-            end = i + 2
-            inner = s[start+2:end-2]
-            spans.append((start, end, inner))
-            i += 2
-            continue
-        i += 1
+        if not stack:
+            raise CompileError("Unbalanced braces: found '}}' without matching '{{'.")
+        start = stack.pop()
+        end = c + 2
+        inner = s[start+2:end-2]
+        spans.append((start, end, inner))
+        i = end
+        c = find("}}", i)
+        if o != -1 and o < i:
+            o = find("{{", i)
     if stack:
         raise CompileError("Unbalanced braces: missing closing '}}'.")
     # Return innermost-first: spans are naturally innermost-first due to stack pops occurring latest-opened first.
@@ -63,9 +69,11 @@ def _find_balanced_double_brace_spans(s: str):
     spans.sort(key=lambda t: t[0], reverse=True)
     return spans
 
-def _process_text(text: str, current_file: Path, stack: list[Path], max_depth: int = 200) -> str:
-    if len(stack) > max_depth:
-        raise CompileError("Max include depth exceeded. Check for cyclic includes.")
+def _process_text(text: str, current_file: Path, stack: list[Path], reads: dict[Path, str], max_depth: int = 200) -> str:
+    # reads caches include path -> raw text for the whole compile.
+    # stack[0] is the entry file, so include depth is len(stack) - 1.
+    if len(stack) - 1 > max_depth:
+        raise CompileError(f"Max include depth ({max_depth}) exceeded.")
     # Keep expanding until no tokens remain.
     while True:
         try:
@@ -89,22 +97,41 @@ def _process_text(text: str, current_file: Path, stack: list[Path], max_depth: i
                 if inc_path in stack:
                     cycle = " -> ".join([str(p) for p in stack + [inc_path]])
                     raise CompileError(f"Cyclic include detected:\n{cycle}")
-                inc_text = _read_file(inc_path)
+                inc_text = reads.get(inc_path)
+                if inc_text is None:
+                    inc_text = reads[inc_path] = _read_file(inc_path)
                 # Recursively process included file in its own context
-                replacement = _process_text(inc_text, inc_path, stack + [inc_path], max_depth=max_depth)
+                replacement = _process_text(inc_text, inc_path, stack + [inc_path], reads, max_depth=max_depth)
             # Splice replacement
             text = text[:start] + replacement + text[end:]
         # Loop to catch new tokens revealed by replacements.
 
-def compile_file(entry: Path, dry_run: bool = False):
+def compile_file(entry: Path, dry_run: bool = False, max_depth: int = 200):
     entry = entry.resolve()
     raw = _read_file(entry)
-    compiled = _process_text(raw, entry, stack=[entry])
+    compiled = _process_text(raw, entry, stack=[entry], reads={}, max_depth=max_depth)
     if dry_run:
         sys.stdout.write(compiled)
     else:
-        with open('prompt_full.txt', 'w') as f:
-            f.write(compiled)
+        out = Path('prompt_full.txt')
+        # Leave an up-to-date output untouched (no rewrite, mtime preserved).
+        try:
+            with open(out, encoding="utf-8") as f:
+                if f.read() == compiled:
+                    return
+        except (OSError, UnicodeDecodeError):
+            pass
+        # Write to a sibling temp file and rename so readers never see a partial file.
+        tmp = out.with_name(out.name + '.tmp')
+        try:
+            with open(tmp, 'w', encoding="utf-8") as f:
+                f.write(compiled)
+                f.flush()
+                os.fsync(f.fileno())
+            tmp.replace(out)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
 
 def main():
     ap = argparse.ArgumentParser(description="Prompt compiler.")
@@ -112,11 +139,11 @@ def main():
     ap.add_argument("--dry-run", action="store_true", help="Print compiled output to stdout instead of writing.")
     ap.add_argument("--max-depth", type=int, default=200, help="Maximum include nesting depth.")
     args = ap.parse_args()
+    if args.max_depth < 0:
+        ap.error("--max-depth must be >= 0")
 
-    # Allow max_depth override
-    global _PROCESS_MAX_DEPTH
     try:
-        compile_file(args.file, dry_run=args.dry_run)
+        compile_file(args.file, dry_run=args.dry_run, max_depth=args.max_depth)
     except CompileError as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)